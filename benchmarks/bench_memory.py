@@ -0,0 +1,100 @@
+"""Benchmark de memoria (tracemalloc) para pools grandes de candidatos.
+
+Compara el fetch previo (dicts crudos de NewsAPI combinados y ordenados) contra
+el pipeline compacto (ArticleRecord parseado respuesta por respuesta) con 10k
+candidatos repartidos en las dos consultas de fetch_news_biased (MX y global).
+
+Reporta:
+- pico: máximo de memoria durante la selección (incluye el JSON crudo de las
+  respuestas, que se "parsea" dentro de la región medida);
+- retenido: memoria que mantienen vivos los `total` artículos seleccionados que
+  main() recibe (la lista combinada ya salió de scope en ambos casos).
+
+Uso:
+    python benchmarks/bench_memory.py [N]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+# Variables dummy para poder importar el módulo sin credenciales reales
+for _var in ("NEWSAPI_KEY", "OPENAI_API_KEY", "LINKEDIN_ACCESS_TOKEN", "LINKEDIN_PERSON_ID"):
+    os.environ.setdefault(_var, "bench")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import lambda_function as lf  # noqa: E402
+
+DOMAINS = [
+    "elfinanciero.com.mx", "expansion.mx", "forbes.com.mx", "eleconomista.com.mx",
+    "techcrunch.com", "theverge.com", "wired.com", "reuters.com",
+]
+WORDS = "banxico fraude inflación regulación startup fintech privacy breach lawsuit cloud ai datos crédito".split()
+
+
+def _fake_raw(i: int) -> dict:
+    domain = random.choice(DOMAINS)
+    title = " ".join(random.choices(WORDS, k=8))
+    return {
+        "source": {"id": None, "name": domain},
+        "author": "Redacción",
+        "title": f"{title} {i}",
+        "description": " ".join(random.choices(WORDS, k=40)),
+        "url": f"https://{domain}/noticias/{i}",
+        "urlToImage": f"https://{domain}/img/{i}.jpg?w=1200&h=630",
+        "publishedAt": "2026-10-19T12:00:00Z",
+        "content": " ".join(random.choices(WORDS, k=400)),
+    }
+
+
+def _fake_response(start: int, stop: int) -> list:
+    """Simula la respuesta parseada de una consulta a NewsAPI."""
+    return [_fake_raw(i) for i in range(start, stop)]
+
+
+def _select_raw(n: int, total: int) -> list:
+    """Comportamiento previo de fetch_news_biased: ambas respuestas vivas + combined."""
+    mx_articles = _fake_response(0, n // 2)
+    gl_articles = _fake_response(n // 2, n)
+    seen = set()
+    combined = []
+    for art in (mx_articles + gl_articles):
+        url = art.get("url")
+        if not url or url in seen:
+            continue
+        seen.add(url)
+        combined.append(art)
+    combined.sort(key=lf._rank_score, reverse=True)
+    return combined[:total]
+
+
+def _select_compact(n: int, total: int) -> list:
+    """Pipeline actual: cada respuesta se compacta y se descarta antes de pedir la siguiente."""
+    seen = set()
+    candidates = lf._compact_articles(_fake_response(0, n // 2), seen)
+    candidates += lf._compact_articles(_fake_response(n // 2, n), seen)
+    return lf._select_top(candidates, total)
+
+
+def _measure(select, n: int, total: int) -> tuple:
+    random.seed(42)
+    tracemalloc.start()
+    selected = select(n, total)
+    alive, peak = tracemalloc.get_traced_memory()
+    del selected
+    # Solo lo que mantiene vivo la selección (excluye caches del intérprete, p.ej. sys.intern)
+    retained = alive - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return retained, peak
+
+
+def main(n: int = 10_000, total: int = 20) -> None:
+    raw_retained, raw_peak = _measure(_select_raw, n, total)
+    compact_retained, compact_peak = _measure(_select_compact, n, total)
+    print(f"candidatos={n} top={total}")
+    print(f"raw dicts:      pico {raw_peak / 2**20:7.2f} MiB  retenido {raw_retained / 2**10:8.1f} KiB")
+    print(f"ArticleRecord:  pico {compact_peak / 2**20:7.2f} MiB  retenido {compact_retained / 2**10:8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
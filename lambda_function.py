@@ -4,12 +4,24 @@ import requests
 import openai
 import logging
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import random
 import json
 import re
 from typing import List, Union, Optional
 import io
+import time
+import heapq
+import hashlib
+import argparse
+import multiprocessing
+import threading
+import cProfile
+import pstats
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
 from fpdf import FPDF
 
 # Cargar variables de entorno desde .env (para desarrollo local)
@@ -23,6 +35,23 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 LINKEDIN_ACCESS_TOKEN = os.environ.get("LINKEDIN_ACCESS_TOKEN")
 LINKEDIN_PERSON_ID = os.environ.get("LINKEDIN_PERSON_ID")
 TOTAL_ARTICLES = int(os.environ.get("TOTAL_ARTICLES", "8"))  # cantidad objetivo por corrida
+# Mezcla de formatos por corrida, p.ej. "poll:0.5,carousel:0.25,image:0.25" (default: solo encuestas)
+FORMAT_MIX = os.environ.get("FORMAT_MIX", "poll:1")
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "8"))  # hilos para generar assets en paralelo
+# Caches en memoria que sobreviven entre invocaciones "warm" del contenedor
+NEWSAPI_CACHE_TTL = int(os.environ.get("NEWSAPI_CACHE_TTL", "900"))  # segundos
+NEWSAPI_CACHE_SIZE = int(os.environ.get("NEWSAPI_CACHE_SIZE", "32"))
+LLM_CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "128"))
+# Modo profiling opt-in (event["profile"] o PROFILE_MODE=1); sin costo cuando está apagado
+def _is_truthy(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+PROFILE_MODE = _is_truthy(os.environ.get("PROFILE_MODE", ""))
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "25"))
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))  # segundos
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "/tmp")
 
 # Unificar clave de OpenAI
 openai.api_key = OPENAI_API_KEY
@@ -53,6 +82,60 @@ STOPWORDS = set(
     "a al algo algunas algunos ante antes como con contra de del desde donde dos el la los las en entre es esa ese eso esta este esto hacia hay hasta la las lo los mas más me mi mis muy no o para pero por que se sin sobre su sus te tu tus un una uno y ya son fue ser si sí".split()
 )
 
+class _LRUCache:
+    """Cache LRU thread-safe con límite de entradas y TTL opcional (segundos)."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = max(0, maxsize)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                stored_at, value = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_newsapi_cache = _LRUCache(NEWSAPI_CACHE_SIZE, ttl=NEWSAPI_CACHE_TTL)
+_llm_cache = _LRUCache(LLM_CACHE_SIZE)
+
+def _llm_cache_key(kind: str, text: str) -> str:
+    return kind + ":" + hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+def cache_stats() -> dict:
+    return {
+        "newsapi": {"size": len(_newsapi_cache), "hits": _newsapi_cache.hits, "misses": _newsapi_cache.misses},
+        "llm": {"size": len(_llm_cache), "hits": _llm_cache.hits, "misses": _llm_cache.misses},
+        "dedup_reloads": _dedup_index["reloads"],
+    }
+
 def _read_local_published() -> set:
     if not os.path.exists(PUBLISHED_ARTICLES_FILE):
         return set()
@@ -97,8 +180,10 @@ def _prune_history(days: int = HISTORY_DAYS) -> list:
     _save_history(keep)
     return keep
 
+_NON_WORD_RE = re.compile(r"[^\wáéíóúñÁÉÍÓÚÑ]+")
+
 def _norm_tokens(s: str) -> set:
-    s = re.sub(r"[^\wáéíóúñÁÉÍÓÚÑ]+", " ", (s or "").lower())
+    s = _NON_WORD_RE.sub(" ", (s or "").lower())
     tokens = [t for t in s.split() if t and t not in STOPWORDS]
     return set(tokens)
 
@@ -112,38 +197,86 @@ def _jaccard(a: set, b: set) -> float:
 def _normalize_text(s: str) -> str:
     return re.sub(r"\s+", " ", (s or "")).strip().lower()
 
+# --- Índice de deduplicación en memoria ---
+# Se reconstruye solo cuando cambia la "generación" en disco (mtime_ns, size) de
+# los archivos de /tmp; las escrituras propias actualizan índice y generación.
+_dedup_index = {"generation": None, "urls": set(), "history": [], "reloads": 0}
+
+def _file_generation(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _dedup_generation() -> tuple:
+    return (_file_generation(PUBLISHED_ARTICLES_FILE), _file_generation(HISTORY_FILE))
+
+def _history_entry(rec: dict) -> Optional[tuple]:
+    try:
+        ts = datetime.fromisoformat(rec.get("ts", ""))
+    except Exception:
+        return None
+    return (ts, rec.get("url"), frozenset(rec.get("title_tokens", [])))
+
+def _load_dedup_index() -> dict:
+    generation = _dedup_generation()
+    if _dedup_index["generation"] != generation:
+        history = [e for e in map(_history_entry, _prune_history(HISTORY_DAYS)) if e]
+        _dedup_index.update(
+            generation=_dedup_generation(),  # _prune_history reescribe el archivo
+            urls=_read_local_published(),
+            history=history,
+            reloads=_dedup_index["reloads"] + 1,
+        )
+    return _dedup_index
+
 def is_already_published(url: str, title: str = "") -> bool:
     url = (url or "").strip()
     if not url:
         return False
+    index = _load_dedup_index()
     # direct URL check
-    if url in _read_local_published():
+    if url in index["urls"]:
         return True
     # heuristic: similar title in recent history
     title_tokens = _norm_tokens(title)
-    history = _prune_history(HISTORY_DAYS)
-    for r in history:
-        if url == r.get("url"):
+    cutoff = datetime.utcnow()
+    for ts, rec_url, tokens in index["history"]:
+        if (cutoff - ts).days > HISTORY_DAYS:
+            continue
+        if url == rec_url:
             return True
-        sim = _jaccard(title_tokens, set(r.get("title_tokens", [])))
+        sim = _jaccard(title_tokens, tokens)
         if sim >= 0.8:  # very similar title
             return True
     return False
 
 def mark_as_published(url: str, title: str = "") -> None:
-    url = (url or "").strip()
-    if not url:
+    mark_many_as_published([(url, title)])
+
+def mark_many_as_published(items: List[tuple]) -> None:
+    """Registra varios (url, title) con una sola poda/escritura del historial."""
+    items = [((url or "").strip(), title) for url, title in items]
+    items = [(url, title) for url, title in items if url]
+    if not items:
         return
-    _append_local_published(url)
-    rec = {
-        "ts": datetime.utcnow().isoformat(timespec="seconds"),
-        "url": url,
-        "title_norm": _normalize_text(title),
-        "title_tokens": sorted(list(_norm_tokens(title)))
-    }
+    index = _load_dedup_index()
+    now = datetime.utcnow().isoformat(timespec="seconds")
+    for url, _ in items:
+        _append_local_published(url)
     history = _prune_history(HISTORY_DAYS)
-    history.append(rec)
+    for url, title in items:
+        history.append({
+            "ts": now,
+            "url": url,
+            "title_norm": _normalize_text(title),
+            "title_tokens": sorted(list(_norm_tokens(title)))
+        })
     _save_history(history)
+    index["urls"].update(url for url, _ in items)
+    index["history"] = [e for e in map(_history_entry, history) if e]
+    index["generation"] = _dedup_generation()
 
 # Rotación temática semanal de bloques (5 bloques, uno por día laboral)
 CATEGORY_BLOCKS = [
@@ -261,11 +394,16 @@ PRO_INTEREST_MX = [
     "telecom", "AMLO", "gasolina", "energía", "Pemex", "CFE", "startups", "inversión",
 ]
 
+# Versiones en minúsculas precalculadas una vez por contenedor
+_CONTROVERSY_KEYWORDS_LOWER = tuple(kw.lower() for kw in CONTROVERSY_KEYWORDS)
+_PRO_INTEREST_MX_LOWER = tuple(kw.lower() for kw in PRO_INTEREST_MX)
+
 
 # --- NewsAPI biased fetch: MX/global, dedup, controversy/interest rank ---
 from math import ceil
 
-def _newsapi_query(query: str, language: str, page_size: int, domains: Optional[str] = None, page: int = 1, since_hours: int = 48, sort_by: str = "relevancy"):
+def _newsapi_query(query: str, language: str, page_size: int, domains: Optional[str] = None, page: int = 1, since_hours: int = 48, sort_by: str = "relevancy", from_dt: Optional[datetime] = None, to_dt: Optional[datetime] = None, raise_errors: bool = False):
+    """Artículos de NewsAPI (solo url/title/description/publishedAt). Errores -> [] salvo raise_errors=True."""
     url = "https://newsapi.org/v2/everything"
     params = {
         "q": query,
@@ -277,70 +415,150 @@ def _newsapi_query(query: str, language: str, page_size: int, domains: Optional[
     }
     if domains:
         params["domains"] = domains
-    # Date window: from now minus since_hours
-    now = datetime.utcnow()
-    from_dt = now - timedelta(hours=since_hours)
+    # Respuestas recientes para la misma consulta se reutilizan (la ventana se mueve poco)
+    cache_key = (query, language, page_size, domains, page, since_hours, sort_by, from_dt, to_dt)
+    cached = _newsapi_cache.get(cache_key)
+    if cached is not None:
+        logger.info("NewsAPI cache hit: %s", query[:60])
+        return list(cached)
+    # Date window: explícita (backfill) o from now minus since_hours
+    to_dt = to_dt or datetime.utcnow()
+    from_dt = from_dt or (to_dt - timedelta(hours=since_hours))
     params["from"] = from_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-    params["to"] = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+    params["to"] = to_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
     try:
         resp = session.get(url, params=params, timeout=HTTP_TIMEOUT)
         resp.raise_for_status()
         data = resp.json()
-        return data.get("articles", [])
     except Exception as e:
         logger.error("NewsAPI request failed: %s", e)
+        if raise_errors:
+            raise
         return []
+    # Guardar solo los campos que usa el pipeline, no el payload completo
+    articles = [
+        {k: a.get(k) for k in ("url", "title", "description", "publishedAt")}
+        for a in data.get("articles", [])
+    ]
+    if articles:
+        _newsapi_cache.put(cache_key, tuple(articles))
+    return articles
 
 
-def _rank_score(article: dict) -> int:
+def _rank_score(article: dict, controversy: Optional[int] = None) -> int:
     # Controversia base
-    c = controversy_score(article)
+    c = controversy_score(article) if controversy is None else controversy
     # Bonificación si contiene palabras clave de interés profesional MX
     text = (article.get("title", "") + " " + article.get("description", "")).lower()
-    bonus = sum(1 for kw in PRO_INTEREST_MX if kw.lower() in text)
+    bonus = sum(1 for kw in _PRO_INTEREST_MX_LOWER if kw in text)
     return c * 2 + min(bonus, 3)  # dar más peso a controversia
 
 
-from datetime import timedelta
+class ArticleRecord:
+    """Registro compacto de un artículo: solo los campos que usa el pipeline.
 
-def fetch_news_biased(total: int = TOTAL_ARTICLES):
-    """Obtiene un set mixto garantizando ~60% MX y ~40% global, priorizando temas polémicos para profesionistas.
-    Devuelve lista de artículos (dict) deduplicados y ordenados por score.
+    El payload crudo de NewsAPI (content, urlToImage, source, ...) se descarta
+    justo después de parsear, así el costo por candidato queda acotado.
+    `domain` (internado) se conserva para logs/diagnóstico; hoy ninguna etapa lo consume.
     """
-    total = max(4, min(total, 20))
-    mx_needed = ceil(total * 0.6)
-    gl_needed = total - mx_needed
+    __slots__ = ("url", "title", "description", "domain", "controversy", "rank")
+
+    def __init__(self, url: str, title: str, description: str, domain: str, controversy: int = 0, rank: int = 0):
+        self.url = url
+        self.title = title
+        self.description = description
+        self.domain = domain
+        self.controversy = controversy
+        self.rank = rank
+
+    def get(self, key: str, default=None):
+        # Compatibilidad con los helpers que reciben dicts (article.get(...))
+        value = getattr(self, key, None) if key in self.__slots__ else None
+        return default if value is None else value
+
+    def __repr__(self) -> str:
+        return f"ArticleRecord(url={self.url!r}, domain={self.domain!r}, rank={self.rank})"
+
+
+def _compact_article(raw: dict) -> Optional[ArticleRecord]:
+    """Convierte un artículo crudo de NewsAPI en ArticleRecord (None si no tiene URL)."""
+    url = (raw.get("url") or "").strip()
+    if not url:
+        return None
+    title = raw.get("title") or ""
+    description = raw.get("description") or ""
+    view = {"title": title, "description": description}
+    controversy = controversy_score(view)
+    return ArticleRecord(
+        url=url,
+        title=title,
+        description=description,
+        # Los dominios se repiten mucho entre candidatos: internarlos comparte una sola copia
+        domain=sys.intern(urlparse(url).netloc.lower()),
+        controversy=controversy,
+        rank=_rank_score(view, controversy),
+    )
+
+
+def _compact_articles(raw_articles: list, seen: set) -> List[ArticleRecord]:
+    """Parsea y deduplica por URL (gana la primera copia); vacía la lista cruda para liberar los payloads."""
+    records = []
+    for raw in raw_articles:
+        rec = _compact_article(raw)
+        if rec is None or rec.url in seen:
+            continue
+        seen.add(rec.url)
+        records.append(rec)
+    raw_articles.clear()
+    return records
+
+
+def _select_top(records: List[ArticleRecord], total: int) -> List[ArticleRecord]:
+    """Top-N por score combinado (estable ante empates, igual que sort reverse)."""
+    return heapq.nlargest(total, records, key=lambda r: r.rank)
 
-    # Variability for NewsAPI params
-    since_hours = random.choice([24, 36, 48, 72])
-    sort_by = random.choice(["publishedAt", "relevancy"])
-    interest_seed = random.choice(PRO_INTEREST_MX)
 
+MX_BIASED_DOMAINS = "elfinanciero.com.mx,expansion.mx,forbes.com.mx,eleconomista.com.mx,animalpolitico.com,aristeguinoticias.com"
+
+def _biased_queries(interest_seed: str, gl_topics: List[str]) -> tuple:
+    """Consultas (MX, global) con boosters de controversia."""
     # MX queries: usar bloque 5 + boosters de controversia
     mx_topics = CATEGORY_BLOCKS[4]
     mx_q = f"({ ' OR '.join(mx_topics) }) (México OR Mexico OR CDMX OR Banxico OR CNBV) (fraude OR multa OR ciberataque OR reforma OR inflación OR tasas OR {interest_seed})"
-    mx_domains = "elfinanciero.com.mx,expansion.mx,forbes.com.mx,eleconomista.com.mx,animalpolitico.com,aristeguinoticias.com"
-    mx_articles = _newsapi_query(mx_q, "es", page_size=mx_needed * 2, domains=mx_domains, since_hours=since_hours, sort_by=sort_by)
-
     # Global queries (no MX) desde bloques 1-4
-    non_mx_blocks = CATEGORY_BLOCKS[:4]
-    gl_topics = random.choice(non_mx_blocks)
     gl_q = f"({ ' OR '.join(gl_topics) }) (fraud OR lawsuit OR breach OR regulation OR layoff OR controversy OR {interest_seed})"
-    gl_articles = _newsapi_query(gl_q, "en", page_size=gl_needed * 2, since_hours=since_hours, sort_by=sort_by)
+    return mx_q, gl_q
+
+def fetch_news_biased(total: int = TOTAL_ARTICLES):
+    """Obtiene un set mixto garantizando ~60% MX y ~40% global, priorizando temas polémicos para profesionistas.
+    Devuelve lista de ArticleRecord deduplicados y ordenados por score.
+    """
+    total = max(4, min(total, 20))
+    mx_needed = ceil(total * 0.6)
+    gl_needed = total - mx_needed
 
-    # Mezclar, deduplicar por URL
+    # Variability for NewsAPI params: semilla fija por bucket de NEWSAPI_CACHE_TTL para que
+    # invocaciones tibias dentro del mismo bucket repitan consultas y acierten el cache
+    rng = random.Random(int(time.time() // NEWSAPI_CACHE_TTL)) if NEWSAPI_CACHE_TTL > 0 else random
+    since_hours = rng.choice([24, 36, 48, 72])
+    sort_by = rng.choice(["publishedAt", "relevancy"])
+    interest_seed = rng.choice(PRO_INTEREST_MX)
+    gl_topics = rng.choice(CATEGORY_BLOCKS[:4])
+    mx_q, gl_q = _biased_queries(interest_seed, gl_topics)
+
+    # Mezclar, deduplicar por URL; los payloads crudos se descartan al parsear
     seen = set()
-    combined = []
-    for art in (mx_articles + gl_articles):
-        url = art.get("url")
-        if not url or url in seen:
-            continue
-        seen.add(url)
-        combined.append(art)
+    candidates = _compact_articles(
+        _newsapi_query(mx_q, "es", page_size=mx_needed * 2, domains=MX_BIASED_DOMAINS, since_hours=since_hours, sort_by=sort_by),
+        seen,
+    )
+    candidates += _compact_articles(
+        _newsapi_query(gl_q, "en", page_size=gl_needed * 2, since_hours=since_hours, sort_by=sort_by),
+        seen,
+    )
 
     # Rankear por score combinado y recortar al total
-    combined.sort(key=_rank_score, reverse=True)
-    selected = combined[:total]
+    selected = _select_top(candidates, total)
     logger.info(f"fetch_news_biased seleccionó {len(selected)} artículos (MX~{mx_needed}, GL~{gl_needed}).")
     return selected
 
@@ -411,7 +629,7 @@ def fetch_image_for_article(article):
         logger.error("UNSPLASH_ACCESS_KEY no está configurado en las variables de entorno.")
         return None
     headers = {"Authorization": f"Client-ID {unsplash_key}"}
-    response = requests.get(url, params=params, headers=headers)
+    response = session.get(url, params=params, headers=headers, timeout=HTTP_TIMEOUT)
     if response.status_code == 200:
          data = response.json()
          results = data.get("results", [])
@@ -423,7 +641,8 @@ def fetch_image_for_article(article):
          logger.error(f"Error al buscar imagen en Unsplash: {response.status_code} {response.text}")
     return None
 
-def summarize_and_rewrite(article):
+def summarize_and_rewrite(article, strict: bool = False):
+    """strict=True propaga el error del LLM en lugar de devolver el texto de respaldo."""
     content = article.get('description', '')
     if len(content.strip()) < 50:
         return article.get('description', 'Not enough content to generate a summary.')
@@ -443,6 +662,10 @@ def summarize_and_rewrite(article):
         "Genera EXACTAMENTE entre 3 y 5 hashtags relevantes en español (sin repetir '#IA') colocados al final del post, en la misma línea.\n\n"
         "Esta es la descripción de la noticia sobre la cual debes escribir:\n\n" + content
     )
+    cache_key = _llm_cache_key("summary", content)
+    cached = _llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         response = openai.ChatCompletion.create(
             model="gpt-3.5-turbo",
@@ -454,9 +677,12 @@ def summarize_and_rewrite(article):
             temperature=0.7
         )
         summary = response.choices[0].message.content.strip()
+        _llm_cache.put(cache_key, summary)
         return summary
     except Exception as e:
         logger.error(f"Error al resumir el artículo: {e}")
+        if strict:
+            raise
         return "Error generating summary 😢."
 
 def controversy_score(article: dict) -> int:
@@ -465,13 +691,14 @@ def controversy_score(article: dict) -> int:
     in the title or description.
     """
     full_text = (article.get("title", "") + " " + article.get("description", "")).lower()
-    hits = sum(1 for kw in CONTROVERSY_KEYWORDS if kw.lower() in full_text)
+    hits = sum(1 for kw in _CONTROVERSY_KEYWORDS_LOWER if kw in full_text)
     return min(hits, 5)
 
 # ----------  PDF Carousel helpers  ----------
-def generate_slides(summary: str) -> List[dict]:
+def generate_slides(summary: str, strict: bool = False) -> List[dict]:
     """
     Devuelve lista de slides [{'title': str, 'points': [str, ...]}]
+    Con strict=True propaga el error en lugar de devolver slides de respaldo.
     """
     prompt = (
         "Divide el siguiente texto en un carrusel de 4 slides para LinkedIn. "
@@ -479,6 +706,10 @@ def generate_slides(summary: str) -> List[dict]:
         "Devuélvelo en JSON: [{'title': str, 'points': [str, str, str]}]\n\n"
         + summary[:1200]
     )
+    cache_key = _llm_cache_key("slides", summary[:1200])
+    cached = _llm_cache.get(cache_key)
+    if cached is not None:
+        return cached
     try:
         import json as _json
         res = openai.ChatCompletion.create(
@@ -487,9 +718,13 @@ def generate_slides(summary: str) -> List[dict]:
             max_tokens=300,
             temperature=0.7
         )
-        return _json.loads(res.choices[0].message.content)
+        slides = _json.loads(res.choices[0].message.content)
+        _llm_cache.put(cache_key, slides)
+        return slides
     except Exception as e:
         logger.error(f"GPT slides fallback: {e}")
+        if strict:
+            raise
         return [
             {"title": "Resumen", "points": [summary[:100], "...", "..."]},
             {"title": "Datos clave", "points": ["…", "…", "…"]},
@@ -501,18 +736,27 @@ class CarouselPDF(FPDF):
     def header(self):
         pass  # no automatic header
 
+_PDF_REPLACEMENTS = {"•": "-", "…": "...", "“": '"', "”": '"', "‘": "'", "’": "'", "–": "-", "—": "-"}
+
+def _pdf_text(text: str) -> str:
+    """Adapta el texto a latin-1 (Helvetica core no soporta emojis ni '•')."""
+    for src, dst in _PDF_REPLACEMENTS.items():
+        text = text.replace(src, dst)
+    return text.encode("latin-1", errors="ignore").decode("latin-1").strip()
+
 def build_pdf(slides: List[dict]) -> bytes:
     pdf = CarouselPDF(orientation="P", unit="pt", format="LETTER")
     pdf.set_auto_page_break(auto=False)
     for slide in slides:
         pdf.add_page()
         pdf.set_font("Helvetica", "B", 24)
-        pdf.multi_cell(0, 40, slide["title"], align="L")
+        pdf.multi_cell(0, 40, _pdf_text(str(slide.get("title", ""))), align="L")
         pdf.ln(10)
         pdf.set_font("Helvetica", "", 14)
-        for pt in slide["points"]:
+        for pt in slide.get("points", []):
+            pt = _pdf_text(str(pt or ""))
             if pt:
-                pdf.multi_cell(0, 18, u"• " + pt, align="L")
+                pdf.multi_cell(0, 18, "- " + pt, align="L")
                 pdf.ln(4)
     buffer = io.BytesIO()
     pdf.output(buffer)
@@ -662,31 +906,316 @@ def post_to_linkedin_shares(content, image_url=None):
         logger.error("Error al publicar en LinkedIn (Shares): %s %s %s", code, text, e)
         raise
 
+# ----------  Scheduler de formatos  ----------
+# Orden de prioridad: los artículos más polémicos van primero a encuesta (debate),
+# luego a carrusel (explicativo) y el resto a publicación con imagen.
+POST_FORMATS = ("poll", "carousel", "image")
+
+def _parse_format_mix(spec: str) -> dict:
+    """Parsea "poll:0.5,carousel:0.25,image:0.25" a pesos normalizados; fallback a solo poll."""
+    weights = {}
+    for part in (spec or "").split(","):
+        name, _, value = part.partition(":")
+        name = name.strip().lower()
+        if name not in POST_FORMATS:
+            continue
+        try:
+            weight = float(value) if value.strip() else 1.0
+        except ValueError:
+            logger.warning("Peso inválido en FORMAT_MIX para %s: %r", name, value)
+            continue
+        if weight > 0:
+            weights[name] = weights.get(name, 0.0) + weight
+    total = sum(weights.values())
+    if not total:
+        return {"poll": 1.0}
+    return {name: w / total for name, w in weights.items()}
+
+def schedule_formats(articles: List[ArticleRecord], mix: Optional[dict] = None) -> List[str]:
+    """
+    Asigna un formato a cada artículo (mismo orden de entrada).
+    Las cuotas salen de la mezcla configurada (mayor residuo) y los artículos
+    con mayor score reciben los formatos de mayor prioridad.
+    """
+    mix = mix or _parse_format_mix(FORMAT_MIX)
+    n = len(articles)
+    quotas = {f: int(n * mix.get(f, 0.0)) for f in POST_FORMATS}
+    remainders = sorted(POST_FORMATS, key=lambda f: (n * mix.get(f, 0.0)) - quotas[f], reverse=True)
+    for f in remainders[: n - sum(quotas.values())]:
+        quotas[f] += 1
+    order = sorted(range(n), key=lambda i: (articles[i].controversy, articles[i].rank), reverse=True)
+    formats = [None] * n
+    slots = [f for f in POST_FORMATS for _ in range(quotas[f])]
+    for i, fmt in zip(order, slots):
+        formats[i] = fmt
+    return formats
+
+def generate_assets(articles: List[ArticleRecord], formats: List[str], render_pdf: bool = True, strict: bool = False) -> List[dict]:
+    """
+    Genera en paralelo los assets de cada artículo según su formato.
+    El resumen se calcula una sola vez y se comparte; la búsqueda de imagen
+    arranca junto con el resumen porque no depende de él.
+    Con render_pdf=False el carrusel queda en slides JSON (el PDF se renderiza aparte).
+    Con strict=True los errores del LLM no usan textos de respaldo: el artículo
+    queda con failed=True (sin degradar a encuesta) para reintentarlo después.
+    Devuelve [{'format', 'summary', 'poll', 'slides', 'pdf', 'image', 'failed'}] en el orden de entrada.
+    """
+    results = [
+        {"format": fmt, "summary": None, "poll": None, "slides": None, "pdf": None, "image": None, "failed": False}
+        for fmt in formats
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as pool:
+        pending = {}
+        for i, (art, fmt) in enumerate(zip(articles, formats)):
+            pending[_submit(pool, summarize_and_rewrite, art, strict=strict)] = (i, "summary")
+            if fmt == "image":
+                pending[_submit(pool, fetch_image_for_article, art)] = (i, "image")
+        # Encadenar los assets que dependen del resumen conforme van terminando
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                i, key = pending.pop(fut)
+                try:
+                    value = fut.result()
+                except Exception as e:
+                    logger.error("Error generando asset '%s' para %s: %s", key, articles[i].url, e)
+                    value = None
+                    if strict and key != "image":
+                        results[i]["failed"] = True
+                    elif key in ("slides", "pdf"):
+                        # Sin PDF no hay carrusel: degradar a encuesta
+                        results[i]["format"] = "poll"
+                        pending[_submit(pool, generate_dynamic_poll, results[i]["summary"])] = (i, "poll")
+                results[i][key] = value
+                fmt = results[i]["format"]
+                if value is None:
+                    if key == "summary" and fmt == "carousel":
+                        results[i]["format"] = "poll"
+                    continue
+                if key == "summary" and fmt == "poll":
+                    pending[_submit(pool, generate_dynamic_poll, value, strict=strict)] = (i, "poll")
+                elif key == "summary" and fmt == "carousel":
+                    pending[_submit(pool, generate_slides, value, strict=strict)] = (i, "slides")
+                elif key == "slides" and render_pdf:
+                    pending[_submit(pool, build_pdf, value)] = (i, "pdf")
+    return results
+
+def _build_commentary(art: ArticleRecord, assets: dict) -> str:
+    content = f"{assets['summary']}\n\nFuente 👉 {art.url}"
+    image = assets.get("image") or {}
+    if assets["format"] == "image" and image.get("author_name"):
+        content += f"\n📷 Foto: {image['author_name']} en Unsplash"
+    return content
+
+def publish_article(art: ArticleRecord, assets: dict) -> None:
+    """Publica un artículo por el endpoint que corresponde a su formato."""
+    content = _build_commentary(art, assets)
+    fmt = assets["format"]
+    try:
+        if fmt == "carousel":
+            asset_urn = register_pdf_asset(assets["pdf"])
+            post_document(asset_urn, content)
+            return
+        if fmt == "image":
+            image = assets.get("image") or {}
+            post_to_linkedin_shares(content, image.get("image_url") or None)
+            return
+    except Exception as e:
+        # Carrusel/imagen fallaron: publicar como encuesta para no perder la noticia
+        logger.error("Falló publicación '%s' de %s, se publica como encuesta: %s", fmt, art.url, e)
+        content = _build_commentary(art, {**assets, "format": "poll"})
+    question, options = assets["poll"] or generate_dynamic_poll(assets["summary"])
+    options = _sanitize_poll_options(options)
+    post_to_linkedin_poll(content, question, options)
+
+# ----------  Profiling  ----------
+# Lista de (etapa, wall, cpu) mientras hay profiling activo; None = apagado.
+_stage_timings = None
+_active_sampler = None
+_worker_profiles = None  # cProfile por tarea de los pools mientras hay profiling
+_worker_profiles_lock = threading.Lock()
+
+def _cpu_now() -> float:
+    """CPU del proceso (incluye hilos) sin contar el trabajo del muestreador de stacks."""
+    sampler_cpu = _active_sampler.cpu_time if _active_sampler is not None else 0.0
+    return time.process_time() - sampler_cpu
+
+@contextmanager
+def _stage(name: str):
+    """Mide wall y CPU de una etapa si hay profiling (CPU incluye hilos, excluye el sampler)."""
+    if _stage_timings is None:
+        yield
+        return
+    wall0, cpu0 = time.perf_counter(), _cpu_now()
+    try:
+        yield
+    finally:
+        _stage_timings.append((name, time.perf_counter() - wall0, _cpu_now() - cpu0))
+
+def _submit(pool, fn, *args, **kwargs):
+    """pool.submit que, con profiling activo, corre la tarea bajo su propio cProfile."""
+    if _worker_profiles is None:
+        return pool.submit(fn, *args, **kwargs)
+    return pool.submit(_run_task_profiled, _worker_profiles, fn, *args, **kwargs)
+
+def _run_task_profiled(profiles: list, fn, *args, **kwargs):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+: cProfile es global (sys.monitoring) y el del handler ya cubre este hilo
+        return fn(*args, **kwargs)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        with _worker_profiles_lock:
+            profiles.append(profiler)
+
+# Frames hoja (archivo, función) de hilos bloqueados: I/O, locks, colas, pools ociosos.
+# time.sleep y otras esperas en C no tienen frame propio y cuentan como trabajo.
+_IDLE_LEAVES = frozenset({
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"), ("thread.py", "_worker"), ("selectors.py", "select"),
+    ("socket.py", "readinto"), ("ssl.py", "read"), ("ssl.py", "recv_into"),
+})
+
+class _StackSampler(threading.Thread):
+    """
+    Muestreador de stacks de todos los hilos; produce formato collapsed (flamegraph.pl).
+    Las muestras cuya hoja es una espera conocida (_IDLE_LEAVES) van a idle_samples,
+    así `samples` aproxima dónde se trabaja y no el tiempo de pared.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.samples = Counter()
+        self.idle_samples = Counter()
+        self.cpu_time = 0.0  # CPU propio del sampler, para descontarlo de las etapas
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        cpu0 = time.thread_time()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop_event.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(tid, str(tid)))
+                target = self.idle_samples if leaf in _IDLE_LEAVES else self.samples
+                target[";".join(reversed(stack))] += 1
+            self.cpu_time = time.thread_time() - cpu0
+        self.cpu_time = time.thread_time() - cpu0
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self, idle: bool = False) -> str:
+        samples = self.idle_samples if idle else self.samples
+        return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+def _profiling_requested(event) -> bool:
+    if isinstance(event, dict) and "profile" in event:
+        return _is_truthy(event.get("profile"))
+    return PROFILE_MODE
+
+def run_profiled(fn, *args, **kwargs):
+    """
+    Ejecuta fn bajo cProfile (hilo principal y tareas lanzadas con _submit) + muestreo
+    de stacks (todos los hilos).
+    Escribe en PROFILE_DIR el collapsed-stack y el resumen top-N, y los loguea.
+    El CPU reportado descuenta al sampler, pero sí incluye el overhead de cProfile.
+    """
+    global _stage_timings, _active_sampler, _worker_profiles
+    _stage_timings = []
+    _worker_profiles = workers = []
+    sampler = _StackSampler(PROFILE_SAMPLE_INTERVAL)
+    _active_sampler = sampler
+    profiler = cProfile.Profile()
+    wall0, cpu0 = time.perf_counter(), _cpu_now()
+    sampler.start()
+    profiler.enable()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        profiler.disable()
+        sampler.stop()
+        wall, cpu = time.perf_counter() - wall0, _cpu_now() - cpu0
+        stages, _stage_timings = _stage_timings, None
+        _active_sampler = None
+        _worker_profiles = None
+        _write_profile_report([profiler] + workers, sampler, stages, wall, cpu)
+
+def _write_profile_report(profilers: List[cProfile.Profile], sampler: _StackSampler, stages: list, wall: float, cpu: float) -> None:
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    lines = [f"{'etapa':<20}{'wall_s':>10}{'cpu_s':>10}{'espera_s':>10}"]
+    for name, s_wall, s_cpu in stages + [("total", wall, cpu)]:
+        lines.append(f"{name:<20}{s_wall:>10.3f}{s_cpu:>10.3f}{max(s_wall - s_cpu, 0.0):>10.3f}")
+    stage_table = "\n".join(lines)
+
+    buf = io.StringIO()
+    # Handler + tareas de los pools combinados en un solo top-N
+    pstats.Stats(*profilers, stream=buf).sort_stats("tottime", "cumulative").print_stats(PROFILE_TOP_N)
+    summary = stage_table + "\n\n" + buf.getvalue()
+
+    collapsed_path = os.path.join(PROFILE_DIR, f"profile-{stamp}.collapsed")
+    idle_path = os.path.join(PROFILE_DIR, f"profile-{stamp}.idle.collapsed")
+    summary_path = os.path.join(PROFILE_DIR, f"profile-{stamp}.txt")
+    try:
+        with open(collapsed_path, "w") as f:
+            f.write(sampler.collapsed())
+        with open(idle_path, "w") as f:
+            f.write(sampler.collapsed(idle=True))
+        with open(summary_path, "w") as f:
+            f.write(summary)
+    except OSError as e:
+        logger.error("No se pudo escribir el reporte de profiling: %s", e)
+    logger.info("Profiling por etapa (wall vs CPU):\n%s", stage_table)
+    logger.info("Profiling top-%d (cProfile):\n%s", PROFILE_TOP_N, buf.getvalue())
+    logger.info("Profiling: %d muestras activas -> %s ; %d en espera -> %s ; resumen -> %s",
+                sum(sampler.samples.values()), collapsed_path,
+                sum(sampler.idle_samples.values()), idle_path, summary_path)
+
 def main():
-    articles = fetch_news_biased(TOTAL_ARTICLES)
+    with _stage("fetch"):
+        articles = fetch_news_biased(TOTAL_ARTICLES)
     logger.info(f"Artículos obtenidos: {len(articles) if articles else 0}")
     if not articles:
         return
 
-    processed = []  # list of tuples (score, article, summary)
-    for art in articles:
-        if is_already_published(art.get("url", ""), art.get("title", "")):
-            logger.info(f"Artículo ya publicado, se omite: {art['url']}")
-            continue
-        summary = summarize_and_rewrite(art)
-        score = controversy_score(art)
-        processed.append((score, art, summary))
+    pending = []
+    with _stage("dedup"):
+        for art in articles:
+            if is_already_published(art.url, art.title):
+                logger.info(f"Artículo ya publicado, se omite: {art.url}")
+                continue
+            pending.append(art)
 
-    if not processed:
+    if not pending:
         return
 
-    # Publicar **todas** las noticias como encuesta (poll)
-    for score, art, summary in processed:
-        content = f"{summary}\n\nFuente 👉 {art['url']}"
-        question, options = generate_dynamic_poll(summary)
-        options = _sanitize_poll_options(options)
-        post_to_linkedin_poll(content, question, options)
-        mark_as_published(art["url"], art.get("title", ""))
+    formats = schedule_formats(pending)
+    logger.info("Formatos asignados: %s", formats)
+    with _stage("generate_assets"):
+        processed = generate_assets(pending, formats)
+
+    # Publicar en orden, cada noticia por el endpoint de su formato
+    with _stage("publish"):
+        for art, assets in zip(pending, processed):
+            publish_article(art, assets)
+            mark_as_published(art.url, art.title)
+    logger.info("Estado de caches: %s", cache_stats())
 
 
 # --- Helper: Sanitiza opciones de encuesta a 2–3 palabras ---
@@ -719,9 +1248,10 @@ def _sanitize_poll_options(options: List[str]) -> List[str]:
             break
     return out
 
-def generate_dynamic_poll(summary: str) -> tuple[str, List[str]]:
+def generate_dynamic_poll(summary: str, strict: bool = False) -> tuple[str, List[str]]:
     """
     Usa OpenAI para generar una pregunta provocadora tipo encuesta y 4 opciones (2–3 palabras c/u).
+    Con strict=True propaga el error en lugar de devolver la encuesta genérica.
     """
     prompt = (
         "Eres un estratega de contenido para LinkedIn con enfoque en noticias tech, economía y controversias actuales. "
@@ -736,6 +1266,10 @@ def generate_dynamic_poll(summary: str) -> tuple[str, List[str]]:
         "}\n\n"
         f"Resumen de la noticia:\n{summary}"
     )
+    cache_key = _llm_cache_key("poll", summary)
+    cached = _llm_cache.get(cache_key)
+    if cached is not None:
+        return cached[0], list(cached[1])
     try:
         import json as _json
         res = openai.ChatCompletion.create(
@@ -754,9 +1288,12 @@ def generate_dynamic_poll(summary: str) -> tuple[str, List[str]]:
         while len(options) < 4 and i < len(defaults):
             options.append(defaults[i])
             i += 1
+        _llm_cache.put(cache_key, (question, tuple(options)))
         return question, options
     except Exception as e:
         logger.error(f"Error generando encuesta dinámica con OpenAI: {e}")
+        if strict:
+            raise
         return (
             "¿Qué opinas sobre esta noticia?",
             ["Interesa mucho", "Me preocupa", "Exagerado", "Más contexto"]
@@ -765,8 +1302,333 @@ def generate_dynamic_poll(summary: str) -> tuple[str, List[str]]:
 def lambda_handler(event, context):
     # Log de inicio de la función Lambda
     logger.info("Lambda handler invoked: inicio de ejecución.")
-    main()
+    if _profiling_requested(event):
+        run_profiled(main)
+    else:
+        main()
     return {
         "statusCode": 200,
         "body": "Ejecución finalizada correctamente."
-    }
\ No newline at end of file
+    }
+
+
+# ----------  Backfill / catch-up  ----------
+# Recorre un rango de fechas en ventanas paralelas, deduplica todo el rango en un
+# solo índice, genera contenido bajo un presupuesto de LLM y escribe a disco
+# (cola de publicación JSONL + PDFs) en lugar de publicar. Reanudable por checkpoint.
+BACKFILL_DIR = os.environ.get("BACKFILL_DIR", "backfill_out")
+BACKFILL_BUDGET_USD = float(os.environ.get("BACKFILL_BUDGET_USD", "2.0"))
+BACKFILL_MAX_ATTEMPTS = int(os.environ.get("BACKFILL_MAX_ATTEMPTS", "3"))  # intentos de LLM por artículo
+# USD por 1K tokens (entrada, salida)
+LLM_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+}
+
+def _llm_cost(model: str, prompt_chars: int, max_tokens: int) -> float:
+    """Costo conservador: ~4 caracteres por token y la salida completa de max_tokens."""
+    price_in, price_out = LLM_PRICES[model]
+    return (prompt_chars / 4) / 1000 * price_in + max_tokens / 1000 * price_out
+
+def estimate_article_cost(art: ArticleRecord, fmt: str) -> float:
+    cost = 0.0
+    if len(art.description.strip()) >= 50:  # summarize_and_rewrite no llama al LLM con menos
+        cost += _llm_cost("gpt-3.5-turbo", 1900 + len(art.description), 1000)
+    if fmt == "poll":
+        cost += _llm_cost("gpt-4", 800 + 2000, 300)
+    elif fmt == "carousel":
+        cost += _llm_cost("gpt-3.5-turbo", 250 + 1200, 300)
+    return cost
+
+class _RangeDedupIndex:
+    """URLs + títulos similares (Jaccard >= 0.8) de todo el rango, con índice invertido por token."""
+
+    def __init__(self):
+        self.urls = set()
+        self._tokens = []
+        self._postings = {}
+
+    def add(self, art: ArticleRecord) -> bool:
+        """Agrega el artículo si es nuevo; False si es duplicado."""
+        if art.url in self.urls:
+            return False
+        tokens = frozenset(_norm_tokens(art.title))
+        overlap = Counter()
+        for t in tokens:
+            overlap.update(self._postings.get(t, ()))
+        for j, inter in overlap.items():
+            union = len(tokens) + len(self._tokens[j]) - inter
+            if union and inter / union >= 0.8:
+                return False
+        self.urls.add(art.url)
+        for t in tokens:
+            self._postings.setdefault(t, []).append(len(self._tokens))
+        self._tokens.append(tokens)
+        return True
+
+def _naive_utc(dt: datetime) -> datetime:
+    """Normaliza a UTC sin tzinfo (el resto del módulo usa datetime.utcnow())."""
+    if dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _backfill_windows(start: datetime, end: datetime, window_hours: int) -> List[tuple]:
+    step = timedelta(hours=max(1, window_hours))
+    windows = []
+    cur = start
+    while cur < end:
+        windows.append((cur, min(cur + step, end)))
+        cur += step
+    return windows
+
+def _fetch_window(from_dt: datetime, to_dt: datetime, per_window: int) -> list:
+    """Consultas MX/global de una ventana; la semilla por ventana hace reproducible el resume.
+    Propaga errores de NewsAPI para que la ventana no quede marcada como hecha.
+    """
+    rng = random.Random(from_dt.isoformat())
+    mx_q, gl_q = _biased_queries(rng.choice(PRO_INTEREST_MX), rng.choice(CATEGORY_BLOCKS[:4]))
+    mx_needed = ceil(per_window * 0.6)
+    gl_needed = per_window - mx_needed
+    raw = _newsapi_query(mx_q, "es", page_size=min(mx_needed * 2, 100), domains=MX_BIASED_DOMAINS, from_dt=from_dt, to_dt=to_dt, raise_errors=True)
+    raw += _newsapi_query(gl_q, "en", page_size=min(gl_needed * 2, 100), from_dt=from_dt, to_dt=to_dt, raise_errors=True)
+    return raw
+
+def _compact_window(raw: list) -> List[ArticleRecord]:
+    # Corre en el pool de procesos: parseo + scoring de keywords
+    return _compact_articles(raw, set())
+
+def _local_pool(workers: Optional[int] = None):
+    """Pool de procesos para etapas CPU; cae a hilos donde no hay multiprocessing (p.ej. Lambda)."""
+    workers = workers or os.cpu_count() or 1
+    try:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    except (OSError, NotImplementedError, ImportError) as e:
+        logger.warning("Sin pool de procesos (%s); se usan hilos para etapas locales.", e)
+        return ThreadPoolExecutor(max_workers=workers)
+
+def _record_to_dict(art: ArticleRecord) -> dict:
+    return {k: getattr(art, k) for k in ArticleRecord.__slots__}
+
+def _load_checkpoint(path: str, params: dict) -> dict:
+    state = {"params": params, "windows_done": [], "candidates": [], "generated": [], "attempts": {}, "spent_usd": 0.0}
+    if not os.path.exists(path):
+        return state
+    with open(path, "r") as f:
+        saved = json.load(f)
+    if saved.get("params") != params:
+        raise ValueError(
+            f"El checkpoint {path} es de otro rango/config ({saved.get('params')}); usa otro directorio de salida."
+        )
+    state.update(saved)
+    logger.info("Reanudando backfill: %d ventanas hechas, %d generados.", len(state["windows_done"]), len(state["generated"]))
+    return state
+
+def _save_checkpoint(path: str, state: dict) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+def _queue_record(art: ArticleRecord, assets: dict, pdf_path: Optional[str]) -> dict:
+    poll = None
+    if assets["format"] == "poll" and assets.get("poll"):
+        question, options = assets["poll"]
+        poll = {"question": question, "options": _sanitize_poll_options(options)}
+    return {
+        **_record_to_dict(art),
+        "format": assets["format"],
+        "commentary": _build_commentary(art, assets),
+        "poll": poll,
+        "slides": assets.get("slides") if assets["format"] == "carousel" else None,
+        "pdf": pdf_path,
+        "image": assets.get("image"),
+        "generated_at": datetime.utcnow().isoformat(timespec="seconds"),
+    }
+
+def run_backfill(
+    start: datetime,
+    end: datetime,
+    window_hours: int = 24,
+    per_window: int = 20,
+    budget_usd: float = BACKFILL_BUDGET_USD,
+    batch_size: int = 8,
+    out_dir: str = BACKFILL_DIR,
+    workers: Optional[int] = None,
+    mark_history: bool = False,
+    skip_llm: bool = False,
+) -> dict:
+    """
+    Procesa [start, end) sin publicar. Escribe en out_dir:
+    queue.jsonl (cola de publicación), pdf/*.pdf, candidates.jsonl (con skip_llm)
+    y checkpoint.json para reanudar.
+    Ventanas con error de NewsAPI y artículos cuyo LLM falló no se marcan como
+    hechos: la siguiente corrida los reintenta, hasta BACKFILL_MAX_ATTEMPTS
+    intentos por artículo. Cada intento cuenta contra el presupuesto, falle o no.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    os.makedirs(os.path.join(out_dir, "pdf"), exist_ok=True)
+    checkpoint_path = os.path.join(out_dir, "checkpoint.json")
+    params = {"start": start.isoformat(), "end": end.isoformat(), "window_hours": window_hours, "per_window": per_window}
+    state = _load_checkpoint(checkpoint_path, params)
+
+    index = _RangeDedupIndex()
+    candidates = [ArticleRecord(**d) for d in state["candidates"]]
+    for art in candidates:
+        index.add(art)
+
+    windows = [w for w in _backfill_windows(start, end, window_hours) if w[0].isoformat() not in state["windows_done"]]
+    with _local_pool(workers) as cpu_pool:
+        # 1) Fetch de ventanas en paralelo (I/O) y parseo/scoring en procesos
+        with ThreadPoolExecutor(max_workers=max(1, MAX_WORKERS)) as io_pool:
+            fetches = {io_pool.submit(_fetch_window, f, t, per_window): f for f, t in windows}
+            compactions = {}
+            failed_windows = 0
+            for fut in as_completed(fetches):
+                try:
+                    raw = fut.result()
+                except Exception as e:
+                    failed_windows += 1
+                    logger.error("Backfill: ventana %s falló, se reintentará: %s", fetches[fut].isoformat(), e)
+                    continue
+                compactions[cpu_pool.submit(_compact_window, raw)] = fetches[fut]
+        for fut in as_completed(compactions):
+            for art in fut.result():
+                if index.add(art) and not is_already_published(art.url, art.title):
+                    candidates.append(art)
+            state["windows_done"].append(compactions[fut].isoformat())
+            state["candidates"] = [_record_to_dict(a) for a in candidates]
+            _save_checkpoint(checkpoint_path, state)
+        logger.info("Backfill: %d ventanas, %d candidatos únicos.", len(state["windows_done"]), len(candidates))
+
+        ranked = sorted(candidates, key=lambda r: r.rank, reverse=True)
+        summary = {
+            "windows": len(state["windows_done"]),
+            "failed_windows": failed_windows,
+            "candidates": len(ranked),
+            "out_dir": out_dir,
+        }
+        if skip_llm:
+            with open(os.path.join(out_dir, "candidates.jsonl"), "w") as f:
+                for art in ranked:
+                    f.write(json.dumps(_record_to_dict(art), ensure_ascii=False) + "\n")
+            if mark_history:
+                # Los candidatos restaurados del checkpoint ya se marcaron en una corrida previa
+                known = _load_dedup_index()["urls"]
+                mark_many_as_published([(a.url, a.title) for a in ranked if a.url not in known])
+            return summary
+
+        # 2) Selección bajo presupuesto: mayor score primero
+        done = set(state["generated"])
+        attempts = state["attempts"]
+        spent = state["spent_usd"]
+        reserved = spent
+        selected, skipped, exhausted = [], 0, 0
+        for art, fmt in zip(ranked, schedule_formats(ranked)):
+            if art.url in done:
+                continue
+            if attempts.get(art.url, 0) >= BACKFILL_MAX_ATTEMPTS:
+                exhausted += 1
+                continue
+            cost = estimate_article_cost(art, fmt)
+            if reserved + cost > budget_usd:
+                skipped += 1
+                continue
+            reserved += cost
+            selected.append((art, fmt, cost))
+        logger.info("Backfill: %d artículos a generar (~$%.2f de $%.2f), %d fuera de presupuesto, %d sin intentos.",
+                    len(selected), reserved, budget_usd, skipped, exhausted)
+
+        # 3) Generación por lotes (LLM en hilos, PDFs en procesos) + checkpoint por lote
+        queue_path = os.path.join(out_dir, "queue.jsonl")
+        failed = 0
+        for b in range(0, len(selected), max(1, batch_size)):
+            batch = selected[b:b + batch_size]
+            arts = [a for a, _, _ in batch]
+            results = generate_assets(arts, [f for _, f, _ in batch], render_pdf=False, strict=True)
+            carousels = [i for i, r in enumerate(results) if r["format"] == "carousel" and r["slides"] and not r["failed"]]
+            pdf_paths = {}
+            pdf_futures = {cpu_pool.submit(build_pdf, results[i]["slides"]): i for i in carousels}
+            for fut in as_completed(pdf_futures):
+                i = pdf_futures[fut]
+                try:
+                    pdf_bytes = fut.result()
+                except Exception as e:
+                    logger.error("Error renderizando PDF para %s: %s", arts[i].url, e)
+                    results[i]["failed"] = True
+                    continue
+                rel_path = os.path.join("pdf", hashlib.sha1(arts[i].url.encode("utf-8")).hexdigest() + ".pdf")
+                with open(os.path.join(out_dir, rel_path), "wb") as f:
+                    f.write(pdf_bytes)
+                pdf_paths[i] = rel_path
+            # Solo lo generado de verdad entra a la cola y al historial; el LLM se cobra igual
+            ok = [i for i, r in enumerate(results) if not r["failed"]]
+            failed += len(batch) - len(ok)
+            with open(queue_path, "a") as f:
+                for i in ok:
+                    f.write(json.dumps(_queue_record(arts[i], results[i], pdf_paths.get(i)), ensure_ascii=False) + "\n")
+            if mark_history:
+                mark_many_as_published([(arts[i].url, arts[i].title) for i in ok])
+            spent += sum(cost for _, _, cost in batch)
+            for art in arts:
+                attempts[art.url] = attempts.get(art.url, 0) + 1
+            state["generated"].extend(arts[i].url for i in ok)
+            state["spent_usd"] = spent
+            _save_checkpoint(checkpoint_path, state)
+            logger.info("Backfill: lote %d listo (%d/%d), ~$%.2f gastado.",
+                        b // batch_size + 1, min(b + batch_size, len(selected)), len(selected), spent)
+
+    summary.update(generated=len(state["generated"]), failed=failed, skipped_budget=skipped,
+                   skipped_attempts=exhausted, spent_usd=round(spent, 4))
+    return summary
+
+
+def _parse_cli_datetime(value: str) -> datetime:
+    try:
+        return _naive_utc(datetime.fromisoformat(value))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fecha inválida: {value!r} (usa YYYY-MM-DD o ISO 8601)")
+
+def _parse_cli_end(value: str) -> datetime:
+    # Solo fecha = día completo incluido
+    end = _parse_cli_datetime(value)
+    return end + timedelta(days=1) if re.fullmatch(r"\d{4}-\d{2}-\d{2}", value.strip()) else end
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="News LinkedIn Publisher")
+    sub = parser.add_subparsers(dest="command")
+    sub.add_parser("run", help="Ejecuta una corrida normal (igual que lambda_handler).")
+    bf = sub.add_parser("backfill", help="Procesa un rango de fechas y escribe a disco sin publicar.")
+    bf.add_argument("--start", required=True, type=_parse_cli_datetime, help="Inicio del rango (UTC).")
+    bf.add_argument("--end", required=True, type=_parse_cli_end,
+                    help="Fin del rango (UTC). Si es solo fecha, incluye ese día completo.")
+    bf.add_argument("--window-hours", type=int, default=24)
+    bf.add_argument("--per-window", type=int, default=20, help="Artículos objetivo por ventana.")
+    bf.add_argument("--budget-usd", type=float, default=BACKFILL_BUDGET_USD)
+    bf.add_argument("--batch-size", type=int, default=8)
+    bf.add_argument("--out", default=BACKFILL_DIR, help="Directorio de salida y checkpoint.")
+    bf.add_argument("--workers", type=int, default=None, help="Procesos para etapas locales (default: todos los cores).")
+    bf.add_argument("--mark-history", action="store_true",
+                    help="Registra los artículos en el historial de dedup LOCAL (/tmp de esta máquina, "
+                         "se poda tras HISTORY_DAYS). No afecta al /tmp del Lambda desplegado.")
+    bf.add_argument("--skip-llm", action="store_true", help="Solo fetch + dedup + ranking (candidates.jsonl).")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = _parse_args()
+    if args.command == "backfill":
+        result = run_backfill(
+            args.start,
+            args.end,
+            window_hours=args.window_hours,
+            per_window=args.per_window,
+            budget_usd=args.budget_usd,
+            batch_size=args.batch_size,
+            out_dir=args.out,
+            workers=args.workers,
+            mark_history=args.mark_history,
+            skip_llm=args.skip_llm,
+        )
+        print(json.dumps(result, ensure_ascii=False))
+    else:
+        lambda_handler({}, None)
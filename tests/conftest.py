@@ -0,0 +1,8 @@
+import os
+import sys
+
+# lambda_function valida estas variables al importarse
+for _var in ("NEWSAPI_KEY", "OPENAI_API_KEY", "LINKEDIN_ACCESS_TOKEN", "LINKEDIN_PERSON_ID"):
+    os.environ.setdefault(_var, "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,427 @@
+import json
+import types
+
+import pytest
+
+import lambda_function as lf
+
+
+def _record(i, controversy=0, rank=0, title=None, domain="example.com"):
+    return lf.ArticleRecord(
+        url=f"https://{domain}/{i}",
+        title=title if title is not None else f"nota {i}",
+        description="d" * 80,
+        domain=domain,
+        controversy=controversy,
+        rank=rank,
+    )
+
+
+# ----------  Formatos  ----------
+
+def test_parse_format_mix_normalizes_weights():
+    assert lf._parse_format_mix("poll:2,image:2") == {"poll": 0.5, "image": 0.5}
+
+
+def test_parse_format_mix_ignores_invalid_and_zero_weights():
+    mix = lf._parse_format_mix("poll:abc,carousel:0,image:-1,video:3,poll:1")
+    assert mix == {"poll": 1.0}
+
+
+@pytest.mark.parametrize("spec", ["", "carousel:0", "video:1", "poll:nope"])
+def test_parse_format_mix_falls_back_to_poll(spec):
+    assert lf._parse_format_mix(spec) == {"poll": 1.0}
+
+
+def test_schedule_formats_default_is_poll_only():
+    arts = [_record(i) for i in range(3)]
+    assert lf.schedule_formats(arts, lf._parse_format_mix(lf.FORMAT_MIX)) == ["poll"] * 3
+
+
+def test_schedule_formats_largest_remainder_small_n():
+    # 3 artículos con 0.5/0.25/0.25 -> cuotas 1.5/0.75/0.75 -> 1/0/0 + restos a carousel e image
+    arts = [_record(i, controversy=i) for i in range(3)]
+    mix = {"poll": 0.5, "carousel": 0.25, "image": 0.25}
+    formats = lf.schedule_formats(arts, mix)
+    assert sorted(formats) == ["carousel", "image", "poll"]
+    # El más polémico va a encuesta, el siguiente a carrusel
+    assert formats == ["image", "carousel", "poll"]
+
+
+def test_schedule_formats_quotas_sum_to_n():
+    mix = {"poll": 0.5, "carousel": 0.25, "image": 0.25}
+    for n in range(0, 8):
+        formats = lf.schedule_formats([_record(i) for i in range(n)], mix)
+        assert len(formats) == n
+        assert None not in formats
+
+
+def test_schedule_formats_single_article_goes_to_largest_share():
+    assert lf.schedule_formats([_record(0)], {"poll": 0.5, "carousel": 0.25, "image": 0.25}) == ["poll"]
+
+
+def test_publish_article_falls_back_to_poll(monkeypatch):
+    polls = []
+
+    def failing_upload(pdf_bytes):
+        raise RuntimeError("registerUpload 500")
+
+    monkeypatch.setattr(lf, "register_pdf_asset", failing_upload)
+    monkeypatch.setattr(lf, "generate_dynamic_poll", lambda summary: ("¿Qué opinas?", ["Muy bien", "Muy mal"]))
+    monkeypatch.setattr(lf, "post_to_linkedin_poll", lambda content, q, opts: polls.append((content, q, opts)))
+
+    assets = {"format": "carousel", "summary": "resumen", "poll": None, "slides": [], "pdf": b"%PDF", "image": None}
+    lf.publish_article(_record(1), assets)
+
+    assert len(polls) == 1
+    assert polls[0][1] == "¿Qué opinas?"
+
+
+# ----------  Caches  ----------
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = lf._LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" pasa a ser el más reciente
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_lru_cache_zero_size_stores_nothing():
+    cache = lf._LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_lru_cache_ttl_expires(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(lf, "time", clock)
+    cache = lf._LRUCache(maxsize=4, ttl=10)
+    cache.put("q", ["resultado"])
+    clock.now = 9.9
+    assert cache.get("q") == ["resultado"]
+    clock.now = 10.1
+    assert cache.get("q") is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+class _FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        self.calls.append(params["q"])
+        articles = [
+            {"url": f"https://{params['language']}.example.com/{i}", "title": f"nota {i}", "description": "d" * 80}
+            for i in range(3)
+        ]
+        return types.SimpleNamespace(raise_for_status=lambda: None, json=lambda: {"articles": articles})
+
+
+def test_fetch_news_biased_hits_cache_within_ttl_bucket(monkeypatch):
+    clock = _Clock()
+    clock.now = 10 * lf.NEWSAPI_CACHE_TTL + 1
+    fake = _FakeSession()
+    monkeypatch.setattr(lf, "time", clock)
+    monkeypatch.setattr(lf, "session", fake)
+    monkeypatch.setattr(lf, "_newsapi_cache", lf._LRUCache(8, ttl=lf.NEWSAPI_CACHE_TTL))
+
+    first = lf.fetch_news_biased(total=4)
+    clock.now += lf.NEWSAPI_CACHE_TTL / 2  # mismo bucket: mismas consultas
+    second = lf.fetch_news_biased(total=4)
+
+    assert len(fake.calls) == 2  # solo la primera invocación (MX + global) llega a NewsAPI
+    assert lf._newsapi_cache.hits == 2
+    assert [r.url for r in first] == [r.url for r in second]
+
+
+@pytest.fixture
+def tmp_dedup(tmp_path, monkeypatch):
+    monkeypatch.setattr(lf, "PUBLISHED_ARTICLES_FILE", str(tmp_path / "published_articles.txt"))
+    monkeypatch.setattr(lf, "HISTORY_FILE", str(tmp_path / "published_history.jsonl"))
+    monkeypatch.setattr(lf, "_dedup_index", {"generation": None, "urls": set(), "history": [], "reloads": 0})
+    return tmp_path
+
+
+def test_dedup_index_reused_until_files_change(tmp_dedup):
+    assert not lf.is_already_published("https://a.com/1", "Banxico sube tasas de interés")
+    lf.mark_as_published("https://a.com/1", "Banxico sube tasas de interés")
+    reloads = lf._dedup_index["reloads"]
+
+    # Escrituras propias actualizan el índice sin recargar desde disco
+    assert lf.is_already_published("https://a.com/1")
+    assert lf.is_already_published("https://b.com/2", "Banxico sube las tasas de interés")
+    assert lf._dedup_index["reloads"] == reloads
+
+    # Un cambio externo en /tmp invalida la generación y fuerza recarga
+    with open(lf.PUBLISHED_ARTICLES_FILE, "a") as f:
+        f.write("https://externo.com/9\n")
+    assert lf.is_already_published("https://externo.com/9")
+    assert lf._dedup_index["reloads"] == reloads + 1
+
+
+def test_dedup_index_reloads_when_history_removed(tmp_dedup):
+    lf.mark_as_published("https://a.com/1", "nota sobre fraude")
+    (tmp_dedup / "published_articles.txt").unlink()
+    (tmp_dedup / "published_history.jsonl").unlink()
+    assert not lf.is_already_published("https://a.com/1", "nota sobre fraude")
+
+
+# ----------  Profiling  ----------
+
+@pytest.mark.parametrize(
+    "event, expected",
+    [
+        ({"profile": True}, True),
+        ({"profile": "true"}, True),
+        ({"profile": "1"}, True),
+        ({"profile": "false"}, False),
+        ({"profile": "0"}, False),
+        ({"profile": ""}, False),
+        ({"profile": False}, False),
+    ],
+)
+def test_profiling_requested_parses_event_flag(event, expected):
+    assert lf._profiling_requested(event) is expected
+
+
+def test_profiling_requested_defaults_to_env(monkeypatch):
+    monkeypatch.setattr(lf, "PROFILE_MODE", True)
+    assert lf._profiling_requested({})
+    assert lf._profiling_requested(None)
+
+
+def test_run_profiled_excludes_sampler_cpu(tmp_path, monkeypatch):
+    monkeypatch.setattr(lf, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(lf, "PROFILE_SAMPLE_INTERVAL", 0.001)
+    captured = {}
+    monkeypatch.setattr(lf, "_write_profile_report", lambda prof, sampler, stages, wall, cpu: captured.update(stages=stages))
+
+    def sleepy():
+        with lf._stage("io"):
+            lf.time.sleep(0.3)
+
+    lf.run_profiled(sleepy)
+    (name, wall, cpu), = captured["stages"]
+    assert name == "io"
+    assert wall >= 0.3
+    assert cpu < 0.02
+
+
+def _busy_worker_summary(art, strict=False):
+    return str(sum(i * i for i in range(200_000)))
+
+
+def test_run_profiled_includes_worker_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(lf, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(lf, "summarize_and_rewrite", _busy_worker_summary)
+    monkeypatch.setattr(lf, "generate_dynamic_poll", lambda summary, strict=False: ("¿Qué opinas?", ["A b", "C d"]))
+
+    lf.run_profiled(lf.generate_assets, [_record(1), _record(2)], ["poll", "poll"])
+    report, = tmp_path.glob("profile-*.txt")
+    assert "_busy_worker_summary" in report.read_text()
+    assert lf._worker_profiles is None
+
+
+def test_stack_sampler_separates_idle_threads():
+    release = lf.threading.Event()
+    waiter = lf.threading.Thread(target=release.wait, name="waiter")
+    waiter.start()
+    sampler = lf._StackSampler(0.001)
+    sampler.start()
+    lf.time.sleep(0.05)
+    sampler.stop()
+    release.set()
+    waiter.join()
+    assert any(stack.startswith("waiter;") for stack in sampler.idle_samples)
+    assert not any(stack.startswith("waiter;") for stack in sampler.samples)
+
+
+# ----------  Backfill  ----------
+
+def test_range_dedup_index_drops_similar_titles():
+    index = lf._RangeDedupIndex()
+    assert index.add(_record(1, title="Banxico sube la tasa de interés a 11%"))
+    # Misma URL
+    assert not index.add(_record(1, title="otro título"))
+    # Título casi idéntico en otro medio (Jaccard >= 0.8)
+    assert not index.add(_record(2, title="Banxico sube tasa de interés a 11%", domain="otro.mx"))
+    # Título distinto
+    assert index.add(_record(3, title="CNBV multa a fintech por fraude"))
+    assert index.urls == {"https://example.com/1", "https://example.com/3"}
+
+
+def test_parse_cli_datetime_normalizes_to_naive_utc():
+    start = lf._parse_cli_datetime("2026-10-01T00:00:00Z")
+    assert start.tzinfo is None and start == lf.datetime(2026, 10, 1)
+    assert lf._parse_cli_datetime("2026-10-01T00:00:00-06:00") == lf.datetime(2026, 10, 1, 6)
+    assert lf._parse_cli_end("2026-10-02") == lf.datetime(2026, 10, 3)
+    args = lf._parse_args(["backfill", "--start", "2026-10-01T00:00:00Z", "--end", "2026-10-02"])
+    assert len(lf._backfill_windows(args.start, args.end, 24)) == 2
+
+
+class _FakeNewsAPI:
+    """Respuestas deterministas por ventana; `fail_days` simula errores de red."""
+
+    def __init__(self, fail_days=()):
+        self.fail_days = set(fail_days)
+        self.calls = []
+
+    def __call__(self, query, language, page_size, domains=None, from_dt=None, to_dt=None, raise_errors=False, **kwargs):
+        self.calls.append(from_dt.day)
+        if from_dt.day in self.fail_days:
+            if raise_errors:
+                raise lf.requests.ConnectionError("sin red")
+            return []
+        return [
+            {
+                "url": f"https://{language}.example.com/{from_dt.day}/{i}",
+                "title": f"fraude {language}{from_dt.day}n{i} tema{i} día{from_dt.day}",
+                "description": "Descripción suficientemente larga para pedir un resumen al LLM. " * 2,
+            }
+            for i in range(2)
+        ]
+
+
+class _FakeOpenAI:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def create(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.fail:
+            raise RuntimeError("OpenAI caído")
+        prompt = messages[-1]["content"]
+        if "carrusel" in prompt:
+            content = '[{"title": "T", "points": ["a", "b", "c"]}]'
+        elif "encuesta" in prompt:
+            content = '{"question": "¿Qué opinas?", "options": ["Muy bien", "Muy mal", "Depende mucho", "Sin opinión"]}'
+        else:
+            content = "Resumen generado"
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))]
+        )
+
+
+@pytest.fixture
+def backfill_env(tmp_dedup, monkeypatch):
+    # Hilos en lugar de procesos: los fakes no viajan a procesos spawn
+    monkeypatch.setattr(lf, "_local_pool", lambda workers=None: lf.ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(lf, "_llm_cache", lf._LRUCache(0))
+    monkeypatch.setattr(lf, "_newsapi_cache", lf._LRUCache(0))
+    openai_fake = _FakeOpenAI()
+    monkeypatch.setattr(lf.openai.ChatCompletion, "create", openai_fake.create)
+    return openai_fake
+
+
+def _read_queue(out_dir):
+    path = out_dir / "queue.jsonl"
+    if not path.exists():
+        return []
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def _run(out_dir, **kwargs):
+    return lf.run_backfill(
+        lf.datetime(2026, 10, 1), lf.datetime(2026, 10, 3),
+        per_window=4, budget_usd=10, batch_size=2, out_dir=str(out_dir), **kwargs
+    )
+
+
+def test_backfill_retries_failed_windows_on_resume(tmp_path, monkeypatch, backfill_env):
+    out = tmp_path / "out"
+    news = _FakeNewsAPI(fail_days={2})
+    monkeypatch.setattr(lf, "_newsapi_query", news)
+
+    first = _run(out, skip_llm=True)
+    assert first["windows"] == 1 and first["failed_windows"] == 1
+    checkpoint = json.loads((out / "checkpoint.json").read_text())
+    assert checkpoint["windows_done"] == ["2026-10-01T00:00:00"]
+
+    news.fail_days.clear()
+    news.calls.clear()
+    second = _run(out, skip_llm=True)
+    assert set(news.calls) == {2}  # solo la ventana que falló
+    assert second["windows"] == 2 and second["failed_windows"] == 0
+    assert second["candidates"] == 8
+
+
+def test_backfill_resume_does_not_regenerate(tmp_path, monkeypatch, backfill_env):
+    out = tmp_path / "out"
+    monkeypatch.setattr(lf, "_newsapi_query", _FakeNewsAPI())
+
+    first = _run(out)
+    assert first["generated"] == 8 and first["failed"] == 0
+    queued = _read_queue(out)
+    assert len(queued) == 8
+    assert all(r["commentary"].startswith("Resumen generado") for r in queued)
+
+    calls = backfill_env.calls
+    second = _run(out)
+    assert backfill_env.calls == calls
+    assert second["generated"] == 8
+    assert len(_read_queue(out)) == 8
+
+
+def test_backfill_skips_llm_fallbacks_and_retries(tmp_path, monkeypatch, backfill_env):
+    out = tmp_path / "out"
+    monkeypatch.setattr(lf, "_newsapi_query", _FakeNewsAPI())
+    backfill_env.fail = True
+
+    first = _run(out, mark_history=True)
+    assert first["generated"] == 0 and first["failed"] == 8
+    assert first["spent_usd"] > 0  # los intentos fallidos también consumen presupuesto
+    assert _read_queue(out) == []
+    assert not lf.is_already_published("https://es.example.com/1/0")
+
+    backfill_env.fail = False
+    second = _run(out, mark_history=True)
+    assert second["generated"] == 8 and second["failed"] == 0
+    assert len(_read_queue(out)) == 8
+    assert lf.is_already_published("https://es.example.com/1/0")
+    assert second["spent_usd"] > first["spent_usd"]
+
+
+def test_backfill_skip_llm_rerun_does_not_duplicate_history(tmp_path, monkeypatch, backfill_env):
+    out = tmp_path / "out"
+    monkeypatch.setattr(lf, "_newsapi_query", _FakeNewsAPI())
+
+    first = _run(out, skip_llm=True, mark_history=True)
+    published = (tmp_path / "published_articles.txt").read_text().splitlines()
+    history = (tmp_path / "published_history.jsonl").read_text().splitlines()
+    assert len(published) == first["candidates"] == 8
+
+    _run(out, skip_llm=True, mark_history=True)
+    assert (tmp_path / "published_articles.txt").read_text().splitlines() == published
+    assert len((tmp_path / "published_history.jsonl").read_text().splitlines()) == len(history)
+
+
+def test_backfill_stops_retrying_after_max_attempts(tmp_path, monkeypatch, backfill_env):
+    out = tmp_path / "out"
+    monkeypatch.setattr(lf, "_newsapi_query", _FakeNewsAPI())
+    monkeypatch.setattr(lf, "BACKFILL_MAX_ATTEMPTS", 2)
+    backfill_env.fail = True
+
+    spent = [_run(out)["spent_usd"] for _ in range(2)]
+    calls = backfill_env.calls
+    third = _run(out)
+    assert backfill_env.calls == calls
+    assert third["failed"] == 0 and third["skipped_attempts"] == 8
+    assert third["spent_usd"] == spent[-1] > spent[0]